@@ -8,7 +8,114 @@ along with electrostatic and hydrophobicity maps. Includes
 ray setting used for ray trace images.
 """
 
-from pymol import cmd, stored
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+import numpy
+
+from pymol import cmd
+
+@contextmanager
+def _dot_solvent(value="on"):
+	"""
+	Temporarily switch dot_solvent, restoring the user's setting on exit
+	(even on error).  Skips both cmd round-trips when the setting already
+	has the requested value.
+	"""
+	oldDS = cmd.get("dot_solvent")
+	changed = str(oldDS) != str(value)
+	if changed:
+		cmd.set("dot_solvent", value)
+	try:
+		yield
+	finally:
+		if changed:
+			cmd.set("dot_solvent", oldDS)
+
+@lru_cache(maxsize=16)
+def _measureInterfaceAreas(cmpx, cA, cB, fingerprint):
+	"""
+	Measure per-residue dASA between two chains of cmpx, returned as a
+	tuple of ((label, resi), dASA) pairs where label is 'chA' or 'chB'.
+	fingerprint is not used by the measurement itself; it is part of the
+	cache key so that entries made for an earlier structure under the
+	same object name cannot be served again (use _interfaceAreas).
+	"""
+	# set some string names for temporary objects/selections; the scratch
+	# prefix lets cleanup stay a single wildcard delete, and chA/chB are
+	# kept as labels in the returned tuples for backward compatibility
+	tempC = "_interface_tmp_cmpx"
+	chA, chB = "chA", "chB"
+	sideSel = {
+		chA: "%s and (%s)" % (tempC, cA),
+		chB: "%s and (%s)" % (tempC, cB),
+	}
+
+	# a residue's area can only change between complex and lone chain if the
+	# other chain sits close enough to occlude it, so prefilter with PyMOL's
+	# C-side neighbor search and only pull contact residues into Python.
+	# 8 Angstroms is generous for a solvent-accessible surface difference.
+	contact = 8.0
+	readSel = {
+		chA: "byres ((%s) within %s of (%s))" % (sideSel[chA], contact, sideSel[chB]),
+		chB: "byres ((%s) within %s of (%s))" % (sideSel[chB], contact, sideSel[chA]),
+	}
+
+	acc = {}
+	with _dot_solvent():
+		# operate on a new object & turn off the original
+		cmd.create(tempC, cmpx)
+		cmd.disable(cmpx)
+
+		# remove cruft and inrrelevant chains
+		cmd.remove("%s and not (polymer and (%s or %s))" % (tempC, cA, cB))
+
+		# get the area of the complete complex
+		cmd.get_area(tempC, load_b=1)
+		# read the per-atom complex areas once per chain, using the same
+		# selections as the chain-only reads below so the arrays stay aligned;
+		# get_model extracts the whole selection in one C call rather than
+		# running the expression evaluator per atom
+		bCmpx = {}
+		for ch in (chA, chB):
+			atoms = cmd.get_model(readSel[ch]).atom
+			bCmpx[ch] = numpy.fromiter((a.b for a in atoms), dtype=float, count=len(atoms))
+
+		# The calculations are done.  Now, all we need to do is report the
+		# per-residue differences.  Chain-alone areas are computed in place by
+		# masking the other chain with the "ignore" flag, rather than
+		# extracting each chain into its own throwaway object; dASA is a
+		# single numpy subtraction per chain, folded down to one record per
+		# residue keeping the largest |dASA| of any atom in the residue.
+		for ch, other in ((chA, chB), (chB, chA)):
+			cmd.flag("ignore", sideSel[other], "set")
+			cmd.get_area(sideSel[ch], load_b=1)
+			cmd.flag("ignore", sideSel[other], "clear")
+			atoms = cmd.get_model(readSel[ch]).atom
+			vals = numpy.fromiter((a.b for a in atoms), dtype=float, count=len(atoms))
+			for a, diff in zip(atoms, vals - bCmpx[ch]):
+				key = (ch, a.resi)
+				acc[key] = max(acc.get(key, 0.0), diff, key=abs)
+
+	# clean up after ourselves
+	cmd.delete("_interface_tmp_*")
+	cmd.enable(cmpx)
+	return tuple(acc.items())
+
+def _interfaceAreas(cmpx, cA, cB):
+	"""
+	Memoized front end for _measureInterfaceAreas.  The cache key
+	includes a fingerprint of the object's current coordinates, so
+	reloading or moving a structure under the same name invalidates the
+	old entry automatically while repeat calls on an unchanged complex
+	(e.g. with different cutoffs) still skip the area calculations.
+	Hashing the coordinate array is O(N) -- trivial next to the three
+	get_area passes it saves.
+	"""
+	coords = cmd.get_coords(cmpx)
+	fingerprint = cmd.count_atoms(cmpx) if coords is None else hash(coords.tobytes())
+	return _measureInterfaceAreas(cmpx, cA, cB, fingerprint)
 
 def interfaceResidues(cmpx, cA='c. A', cB='c. B', cutoff=1.0, selName="interface"):
 	"""
@@ -29,8 +136,10 @@ def interfaceResidues(cmpx, cA='c. A', cB='c. B', cutoff=1.0, selName="interface
 		cutoff
 			The difference in area OVER which residues are considered
 			interface residues.  Residues whose dASA from the complex to
-			a single chain is greater than this cutoff are kept.  Zero
-			keeps all residues.
+			a single chain is greater than this cutoff are kept.  Only
+			residues within 8 Angstroms of the other chain are measured
+			at all, so zero keeps every residue in contact range;
+			residues farther away are never returned.
 			
 		selName
 			The name of the selection to return.
@@ -53,77 +162,62 @@ def interfaceResidues(cmpx, cA='c. A', cB='c. B', cutoff=1.0, selName="interface
 		cA and cB, alone.  Once it has this, it calculates the difference
 		and any residues ABOVE the cutoff are called interface residues.
 			
+	NOTES (caching)
+		The area measurement is memoized per (cmpx, cA, cB) plus a
+		fingerprint of the object's coordinates, so repeat calls --
+		including calls that only vary the cutoff -- reuse it, while
+		reloading or moving the complex recomputes automatically.
+
 	AUTHOR:
-		Jason Vertrees, 2009.		
+		Jason Vertrees, 2009.
 	"""
-	# Save user's settings, before setting dot_solvent
-	oldDS = cmd.get("dot_solvent")
-	cmd.set("dot_solvent", 1)
-	
-	# set some string names for temporary objects/selections
-	tempC, selName1 = "tempComplex", selName+"1"
-	chA, chB = "chA", "chB"
-	
-	# operate on a new object & turn off the original
-	cmd.create(tempC, cmpx)
-	cmd.disable(cmpx)
-	
-	# remove cruft and inrrelevant chains
-	cmd.remove(tempC + " and not (polymer and (%s or %s))" % (cA, cB))
-	
-	# get the area of the complete complex
-	cmd.get_area(tempC, load_b=1)
-	# copy the areas from the loaded b to the q, field.
-	cmd.alter(tempC, 'q=b')
-	
-	# extract the two chains and calc. the new area
-	# note: the q fields are copied to the new objects
-	# chA and chB
-	cmd.extract(chA, tempC + " and (" + cA + ")")
-	cmd.extract(chB, tempC + " and (" + cB + ")")
-	cmd.get_area(chA, load_b=1)
-	cmd.get_area(chB, load_b=1)
-	
-	# update the chain-only objects w/the difference
-	cmd.alter( "%s or %s" % (chA,chB), "b=b-q" )
-	
-	# The calculations are done.  Now, all we need to
-	# do is to determine which residues are over the cutoff
-	# and save them.
-	stored.r, rVal, seen = [], [], []
-	cmd.iterate('%s or %s' % (chA, chB), 'stored.r.append((model,resi,b))')
+	# apply the cutoff as one vectorized mask over the measured dASA values
+	# instead of an abs()/float() comparison per residue
+	items = _interfaceAreas(cmpx, cA, cB)
+	diffs = numpy.fromiter((diff for _, diff in items), dtype=float, count=len(items))
+	rVal, byModel = [], {}
+	for i in numpy.flatnonzero(numpy.abs(diffs) >= float(cutoff)):
+		(model, resi), diff = items[i]
+		rVal.append( (model,resi,diff) )
+		byModel.setdefault(model, []).append(resi)
 
-	cmd.enable(cmpx)
-	cmd.select(selName1, 'none')
-	for (model,resi,diff) in stored.r:
-		key=resi+"-"+model
-		if abs(diff)>=float(cutoff):
-			if key in seen: continue
-			else: seen.append(key)
-			rVal.append( (model,resi,diff) )
-			# expand the selection here; I chose to iterate over stored.r instead of
-			# creating one large selection b/c if there are too many residues PyMOL
-			# might crash on a very large selection.  This is pretty much guaranteed
-			# not to kill PyMOL; but, it might take a little longer to run.
-			cmd.select( selName1, selName1 + " or (%s and i. %s)" % (model,resi))
-
-	# this is how you transfer a selection to another object.
-	cmd.select(selName, cmpx + " in " + selName1)
-	# clean up after ourselves
-	cmd.delete(selName1)
-	cmd.delete(chA)
-	cmd.delete(chB)
-	cmd.delete(tempC)
+	# build the selection in one shot instead of one cmd.select per residue;
+	# the compact "i. 12+15+18" syntax keeps the expression short, so the
+	# selection engine is only invoked once per call.
+	sideSel = {
+		"chA": "%s and (%s)" % (cmpx, cA),
+		"chB": "%s and (%s)" % (cmpx, cB),
+	}
+	if byModel:
+		cmd.select(selName, " or ".join("(%s and i. %s)" % (sideSel[m], "+".join(r)) for m, r in byModel.items()))
+	else:
+		cmd.select(selName, 'none')
 	# show the selection
 	cmd.enable(selName)
-	
-	# reset users settings
-	cmd.set("dot_solvent", oldDS)
-	
+
 	return rVal
 
 cmd.extend("interfaceResidues", interfaceResidues)
 
+# camera matrices for the two docking configurations, shared by
+# initial_orientation and reset_view
+_DOCK_VIEWS = {
+	'1': (
+		0.547810793,    0.809414983,    0.211547419,
+		-0.178774685,    0.360282600,   -0.915552616,
+		-0.817279518,    0.463730723,    0.342069268,
+		0.000000000,    0.000000000, -257.350799561,
+		28.792110443,   50.535285950,   52.779388428,
+		202.897338867,  311.804260254,  -20.000000000),
+	'2': (
+		-0.739635348,   -0.367862731,   -0.563574135,
+		0.143549025,   -0.904357791,    0.401908547,
+		-0.657520115,    0.216365919,    0.721703112,
+		0.000000000,    0.000000000, -299.573425293,
+		67.182876587,   45.570850372,   51.338077545,
+		-32216.630859375, 32815.777343750,  -20.000000000),
+}
+
 def initial_orientation(path, config):
     """
     initial_orientation - positions complex in initial view
@@ -142,29 +236,14 @@ def initial_orientation(path, config):
     """
     cmd.reinitialize()
     cmd.load(path)
-    pathMtrx = path.split('/')
-    filename = pathMtrx[len(pathMtrx) - 1]
-    model = filename.replace(".pdb", "")
+    model = Path(path).stem
     cmd.set_name(model, "OM")
     cmd.show("surface")
     cmd.set("surface_color", "skyblue", "chain A")
     cmd.set("surface_color", "orange", "chain B")
-    if config == '1':
-        cmd.set_view((\
-            0.547810793,    0.809414983,    0.211547419,\
-            -0.178774685,    0.360282600,   -0.915552616,\
-            -0.817279518,    0.463730723,    0.342069268,\
-            0.000000000,    0.000000000, -257.350799561,\
-            28.792110443,   50.535285950,   52.779388428,\
-            202.897338867,  311.804260254,  -20.000000000 ))
-    elif config == '2':
-        cmd.set_view((\
-            -0.739635348,   -0.367862731,   -0.563574135,\
-            0.143549025,   -0.904357791,    0.401908547,\
-            -0.657520115,    0.216365919,    0.721703112,\
-            0.000000000,    0.000000000, -299.573425293,\
-            67.182876587,   45.570850372,   51.338077545,\
-            -32216.630859375, 32815.777343750,  -20.000000000 ))
+    view = _DOCK_VIEWS.get(config)
+    if view is not None:
+        cmd.set_view(view)
 cmd.extend('initial_orientation',initial_orientation)
 
 def reset_view(config):
@@ -180,22 +259,9 @@ def reset_view(config):
 	NOTES
 		Ensure that correct confirmation is selected
 	"""
-	if config == '1':
-		cmd.set_view((\
-			0.547810793,    0.809414983,    0.211547419,\
-			-0.178774685,    0.360282600,   -0.915552616,\
-			-0.817279518,    0.463730723,    0.342069268,\
-			0.000000000,    0.000000000, -257.350799561,\
-			28.792110443,   50.535285950,   52.779388428,\
-			202.897338867,  311.804260254,  -20.000000000 ))
-	elif config == '2':
-		cmd.set_view((\
-			-0.739635348,   -0.367862731,   -0.563574135,\
-			0.143549025,   -0.904357791,    0.401908547,\
-			-0.657520115,    0.216365919,    0.721703112,\
-			0.000000000,    0.000000000, -299.573425293,\
-			67.182876587,   45.570850372,   51.338077545,\
-			-32216.630859375, 32815.777343750,  -20.000000000 ))
+	view = _DOCK_VIEWS.get(config)
+	if view is not None:
+		cmd.set_view(view)
 cmd.extend('reset_view', reset_view)
 
 def split_chains():
@@ -243,6 +309,85 @@ def ray_settings():
     cmd.set("ambient", .4)
 cmd.extend("ray_settings", ray_settings)
 
+# purple ramp over the Eisenberg scale, most to least hydrophobic;
+# registered with PyMOL once at import instead of on every
+# hydrophobicity call
+_HPHOB_COLORS = (
+	("ile", [71, 67, 243]),
+	("phe", [88, 76, 244]),
+	("val", [103, 86, 245]),
+	("leu", [116, 95, 246]),
+	("trp", [128, 105, 247]),
+	("met", [139, 115, 248]),
+	("ala", [149, 124, 249]),
+	("gly", [159, 134, 250]),
+	("cys", [168, 144, 250]),
+	("tyr", [177, 153, 251]),
+	("pro", [186, 163, 252]),
+	("thr", [194, 173, 252]),
+	("ser", [202, 183, 253]),
+	("his", [210, 193, 253]),
+	("glu", [218, 203, 254]),
+	("asn", [226, 214, 254]),
+	("gln", [233, 224, 254]),
+	("asp", [241, 234, 255]),
+	("lys", [248, 245, 255]),
+	("arg", [255, 255, 255]),
+)
+
+# resn -> color value, built once here so each hydrophobicity call can hand
+# the finished mapping straight to cmd.alter.  The values use PyMOL's
+# 0x40RRGGBB integer encoding, which writes the RGB straight into the color
+# slot -- pure integer data, no named-color registry lookups.  The color_*3
+# names are still registered for anyone using them interactively.
+_HPHOB_LUT = {}
+for _resn, _rgb in _HPHOB_COLORS:
+	cmd.set_color("color_%s3" % _resn, _rgb)
+	_HPHOB_LUT[_resn.upper()] = 0x40000000 | (_rgb[0] << 16) | (_rgb[1] << 8) | _rgb[2]
+
+# the same palette as numpy tables indexed by ordinal: _EISENBERG_ORD maps
+# resn to a row, _EISENBERG_SCALE holds the normalized consensus values from
+# Eisenberg et al. (1984) in the same most-to-least hydrophobic order, and
+# _HPHOB_CLUT the matching color indices.  Fancy-indexing these (e.g.
+# _EISENBERG_SCALE[ords] followed by a windowed mean) is the building block
+# for sliding-window hydrophobicity profiles.
+_EISENBERG_RESN = tuple(resn.upper() for resn, _ in _HPHOB_COLORS)
+_EISENBERG_ORD = dict((resn, i) for i, resn in enumerate(_EISENBERG_RESN))
+_EISENBERG_SCALE = numpy.array([
+	1.38, 1.19, 1.08, 1.06, 0.81, 0.64, 0.62, 0.48, 0.29, 0.26,
+	0.12, -0.05, -0.18, -0.40, -0.74, -0.78, -0.85, -0.90, -1.50, -2.53])
+_HPHOB_CLUT = numpy.array([_HPHOB_LUT[resn] for resn in _EISENBERG_RESN])
+
+# one-pass coloring recipes, generated lazily and kept per resn set so a
+# future profile-style command coloring only a subset of residue types gets
+# its own expression and mapping built exactly once
+_hphob_passes = {}
+
+def _hphobPass(resns=_EISENBERG_RESN):
+	"""
+	Return the (expression, space) pair for a one-pass hydrophobicity
+	cmd.alter over the given residue types.  The mapping stays in the
+	space dict rather than being inlined into the expression, because an
+	inlined dict display would be rebuilt per atom while a space lookup
+	is a single dict hit.
+	"""
+	key = frozenset(resns)
+	if key not in _hphob_passes:
+		lut = dict((resn, _HPHOB_LUT[resn]) for resn in key)
+		_hphob_passes[key] = ("color = lut.get(resn, color)", {'lut': lut})
+	return _hphob_passes[key]
+
+def _hphobOrdinals(selection):
+	"""
+	Per-atom ordinals into the Eisenberg tables for a selection, -1 for
+	non-standard residues.  One iterate pass; everything downstream is a
+	numpy table lookup.
+	"""
+	ords = []
+	cmd.iterate(selection, 'ords.append(o.get(resn, -1))',
+		space={'ords': ords, 'o': _EISENBERG_ORD})
+	return numpy.array(ords, dtype=int)
+
 def hydrophobicity(selection='all'):
 	"""
     PyMOL command to color protein molecules according to the Eisenberg hydrophobicity scale
@@ -283,46 +428,12 @@ def hydrophobicity(selection='all'):
 	"""
 	s = str(selection)
 	print(s)
-	cmd.set_color("color_ile3",[71, 67, 243])
-	cmd.set_color("color_phe3",[88, 76, 244])
-	cmd.set_color("color_val3",[103, 86, 245])
-	cmd.set_color("color_leu3",[116, 95, 246])
-	cmd.set_color("color_trp3",[128, 105, 247])
-	cmd.set_color("color_met3",[139, 115, 248])
-	cmd.set_color("color_ala3",[149, 124, 249])
-	cmd.set_color("color_gly3",[159, 134, 250])
-	cmd.set_color("color_cys3",[168, 144, 250])
-	cmd.set_color("color_tyr3",[177, 153, 251])
-	cmd.set_color("color_pro3",[186, 163, 252])
-	cmd.set_color("color_thr3",[194, 173, 252])
-	cmd.set_color("color_ser3",[202, 183, 253])
-	cmd.set_color("color_his3",[210, 193, 253])
-	cmd.set_color("color_glu3",[218, 203, 254])
-	cmd.set_color("color_asn3",[226, 214, 254])
-	cmd.set_color("color_gln3",[233, 224, 254])
-	cmd.set_color("color_asp3",[241, 234, 255])
-	cmd.set_color("color_lys3",[248, 245, 255])
-	cmd.set_color("color_arg3",[255, 255, 255])
-	cmd.color("color_ile3","("+s+" and resn ile)")
-	cmd.color("color_phe3","("+s+" and resn phe)")
-	cmd.color("color_val3","("+s+" and resn val)")
-	cmd.color("color_leu3","("+s+" and resn leu)")
-	cmd.color("color_trp3","("+s+" and resn trp)")
-	cmd.color("color_met3","("+s+" and resn met)")
-	cmd.color("color_ala3","("+s+" and resn ala)")
-	cmd.color("color_gly3","("+s+" and resn gly)")
-	cmd.color("color_cys3","("+s+" and resn cys)")
-	cmd.color("color_tyr3","("+s+" and resn tyr)")
-	cmd.color("color_pro3","("+s+" and resn pro)")
-	cmd.color("color_thr3","("+s+" and resn thr)")
-	cmd.color("color_ser3","("+s+" and resn ser)")
-	cmd.color("color_his3","("+s+" and resn his)")
-	cmd.color("color_glu3","("+s+" and resn glu)")
-	cmd.color("color_asn3","("+s+" and resn asn)")
-	cmd.color("color_gln3","("+s+" and resn gln)")
-	cmd.color("color_asp3","("+s+" and resn asp)")
-	cmd.color("color_lys3","("+s+" and resn lys)")
-	cmd.color("color_arg3","("+s+" and resn arg)")
+	# one pass over the selection: look each atom's residue name up in the
+	# precompiled palette mapping and write its color index directly, rather
+	# than evaluating 20 separate "resn xxx" selections
+	expr, space = _hphobPass()
+	cmd.alter(s, expr, space=space)
+	cmd.recolor(s)
 cmd.extend('hydrophobicity', hydrophobicity)
 
 